@@ -0,0 +1,143 @@
+"""This module contains the asyncio variant of the database layer.
+
+The functions of the database module are reused as they are: an AsyncSession runs them
+through run_sync, so the asyncpg/aiosqlite drivers are used without duplicating the queries.
+"""
+
+import asyncio
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+import config
+import database
+import metrics
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+session = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+_engine = None
+
+def get_async_url(url: str) -> str:
+    """Returns the URL with its driver replaced by an asyncio driver."""
+    url = make_url(url)
+    drivername = ASYNC_DRIVERS.get(url.get_backend_name())
+    if drivername is None:
+        raise ValueError(f"There is no asyncio driver for {url.get_backend_name()}")
+    return url.set(drivername=drivername).render_as_string(hide_password=False)
+
+def _create_engine(url: str):
+    """Creates an async engine with the configured connection pool and event listeners."""
+    engine = create_async_engine(url,
+                                 poolclass=(metrics.timed_pool_class(AsyncAdaptedQueuePool)
+                                            if config.METRICS_ENABLED else AsyncAdaptedQueuePool),
+                                 pool_size=config.POOL_SIZE,
+                                 max_overflow=config.MAX_OVERFLOW,
+                                 pool_timeout=config.POOL_TIMEOUT,
+                                 pool_pre_ping=config.POOL_PRE_PING,
+                                 pool_recycle=config.POOL_RECYCLE)
+    database.configure_engine(engine.sync_engine)
+    return engine
+
+def get_engine():
+    """Returns the async engine, creating it on first use."""
+    global _engine # pylint: disable=global-statement
+    if _engine is None:
+        _engine = _create_engine(config.ASYNC_DATABASE_URL or get_async_url(config.DATABASE_URL))
+        session.configure(bind=_engine)
+    return _engine
+
+def get_session() -> AsyncSession:
+    """Returns a new async session bound to the async engine."""
+    get_engine()
+    return session()
+
+_replica_set = None
+
+def get_replica_set() -> database.ReplicaSet:
+    """Returns the replicas of REPLICA_URLS with asyncio drivers, creating them on first use."""
+    global _replica_set # pylint: disable=global-statement
+    if _replica_set is None:
+        _replica_set = database.ReplicaSet([_create_engine(get_async_url(url))
+                                            for url in config.REPLICA_URLS],
+                                           config.REPLICA_RETRY_SECONDS)
+    return _replica_set
+
+def get_read_session(use_primary: bool = False) -> AsyncSession:
+    """Returns a new async session for reading, bound like database.get_read_session."""
+    engine = None if use_primary or not config.REPLICA_URLS else get_replica_set().pick()
+    if engine is None:
+        return get_session()
+    return session(bind=engine, info={"replica": True})
+
+async def dispose_replicas():
+    """Closes the connections of the replica engines if they were created."""
+    if _replica_set is not None:
+        for engine in _replica_set.engines:
+            await engine.dispose()
+
+async def get_db():
+    """Yields an async session for the duration of one request.
+    Intended for use with FastAPI Depends."""
+    async with get_session() as db:
+        yield db
+
+async def run(db, func, *args, **kwargs):
+    """Calls a function of the database module with the given session.
+
+    An AsyncSession runs the function on the event loop through run_sync.
+    A regular Session runs it in a worker thread, so both modes can be compared."""
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(func, *args, **kwargs)
+    return await asyncio.to_thread(func, db, *args, **kwargs)
+
+async def run_in_thread(func, *args):
+    """Calls a function of the database module with a new session of the synchronous engine
+    in a worker thread. For functions that also wait on something other than the database,
+    which run_sync would wait for on the event loop."""
+    def run_in_session():
+        with database.get_session() as db:
+            return func(db, *args)
+
+    return await asyncio.to_thread(run_in_session)
+
+async def verify_password(db, user_id: int, candidate: str) -> bool:
+    """Checks the password of a user like database.verify_password, awaiting the worker
+    process instead of blocking the event loop or a worker thread."""
+    encoded = await run(db, database.get_password_hash, user_id)
+    if encoded is None:
+        return False
+    if not await asyncio.wrap_future(database.submit_password_check(candidate, encoded)):
+        return False
+    if database.needs_rehash(encoded):
+        new_hash = await asyncio.wrap_future(database.submit_password_hash(candidate))
+        await run(db, database.replace_password_hash, user_id, encoded, new_hash)
+    return True
+
+async def iter_partitions(db: AsyncSession, statement,
+                          chunk_size: int = config.STREAM_CHUNK_SIZE):
+    """Yields the rows of a statement in lists of up to chunk_size rows,
+    fetched through a server-side cursor."""
+    result = await db.stream(statement.execution_options(yield_per=chunk_size))
+    async for partition in result.partitions():
+        yield partition
+
+async def run_read(func, *args, use_primary: bool = False):
+    """Calls a function of the database module with a new read session that is closed
+    afterwards, through run_sync in the async mode and in a worker thread otherwise."""
+    if config.DATABASE_ASYNC:
+        async with get_read_session(use_primary) as db:
+            return await db.run_sync(func, *args)
+
+    def run_in_session():
+        with database.get_read_session(use_primary) as db:
+            return func(db, *args)
+
+    return await asyncio.to_thread(run_in_session)
+
+def get_pool_stats():
+    """Returns the current state of the async connection pool."""
+    return database.get_pool_stats(get_engine().sync_engine)
@@ -0,0 +1 @@
+"""Benchmarks for the lab 9 application. Run them from the repository root with python -m."""
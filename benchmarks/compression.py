@@ -0,0 +1,80 @@
+"""Measures the bytes on the wire and the CPU time of compressing the index page
+with every available encoding.
+
+The page is rendered from generated rows, half users and half posts, like the index page
+with that many rows. "ms/request" is the compression time of one response; with the page
+cache a page is compressed once per encoding, so cached hits cost nothing.
+
+Usage: python -m benchmarks.compression [rows ...]
+"""
+
+import random
+import string
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
+import config
+import content_encoding
+from rendering import Markup, load_templates
+
+UserRow = namedtuple("UserRow", "id username email")
+PostRow = namedtuple("PostRow", "id title preview user_id")
+
+LEVELS = {
+    "gzip": (1, config.GZIP_LEVEL, 9),
+    "br": (1, config.BROTLI_QUALITY, 9),
+    "zstd": (1, config.ZSTD_LEVEL, 12),
+}
+
+def random_words(rng: random.Random, count: int) -> str:
+    """Returns random lowercase words, so the text does not compress unrealistically well."""
+    return " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9)))
+                    for _ in range(count))
+
+def render_page(templates, row_count: int) -> bytes:
+    """Returns the index page with row_count rows split between users and posts."""
+    rng = random.Random(row_count)
+    users = [UserRow(i, f"user{i}", f"user{i}@example.com")
+             for i in range(1, row_count // 2 + 1)]
+    posts = [PostRow(i, random_words(rng, 4), random_words(rng, 15), rng.randint(1, len(users)))
+             for i in range(1, row_count - row_count // 2 + 1)]
+    return templates["index"].render(
+        user_rows=templates["user_row"].render_rows(users), user_links=Markup(""),
+        post_rows=templates["post_row"].render_rows(posts), post_links=Markup("")
+    ).encode("utf-8")
+
+def measure(data: bytes, encoding: str, level: int) -> tuple[int, float]:
+    """Returns the compressed size and the best CPU time of up to 10 compressions,
+    stopping early once they took a second."""
+    best = float("inf")
+    total = 0.0
+    for _ in range(10):
+        start = time.process_time()
+        size = len(content_encoding.compress(data, encoding, level))
+        seconds = time.process_time() - start
+        best = min(best, seconds)
+        total += seconds
+        if total > 1:
+            break
+    return size, best
+
+def main():
+    """Prints the sizes and compression times for pages of the given numbers of rows."""
+    row_counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    templates = load_templates(Path(__file__).parent.parent / "templates")
+    encodings = content_encoding.available(["gzip", "br", "zstd"])
+
+    for row_count in row_counts:
+        page = render_page(templates, row_count)
+        print(f"{row_count} rows, {len(page):,} bytes uncompressed")
+        print(f"  {'encoding':>8} {'level':>5} {'bytes':>12} {'ratio':>7} {'ms/request':>11}"
+              f" {'MB/s':>8}")
+        for encoding in encodings:
+            for level in LEVELS[encoding]:
+                size, seconds = measure(page, encoding, level)
+                print(f"  {encoding:>8} {level:>5} {size:>12,} {len(page) / size:>7.1f}"
+                      f" {seconds * 1000:>11.2f} {len(page) / seconds / 1e6:>8.1f}")
+
+if __name__ == "__main__":
+    main()
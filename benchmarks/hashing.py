@@ -0,0 +1,91 @@
+"""Measures password hashing: hashes per second for several scrypt work factors,
+in one process and with pools of worker processes, and how long the event loop stalls
+while passwords are hashed in the default thread pool compared to worker processes.
+hashlib.scrypt releases the GIL; the thread pool stalls the loop because it runs more hashes
+at once than there are CPUs, while the process pool is limited to PASSWORD_HASH_WORKERS.
+
+Usage: python -m benchmarks.hashing [passwords] [workers ...]
+
+The workers default to 1 and the number of CPU cores.
+"""
+
+import asyncio
+import functools
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import config
+import database
+
+WORK_FACTORS = (2 ** 13, 2 ** 14, 2 ** 15)
+
+def hashes_per_second(executor, count: int, n: int) -> float:
+    """Returns the rate of hashing count passwords with a work factor in an executor,
+    or in this process if executor is None."""
+    hash_one = functools.partial(database.hash_password, n=n, r=config.PASSWORD_SCRYPT_R,
+                                 p=config.PASSWORD_SCRYPT_P)
+    passwords = [f"password{i}" for i in range(count)]
+    start = time.perf_counter()
+    if executor is None:
+        list(map(hash_one, passwords))
+    else:
+        list(executor.map(hash_one, passwords))
+    return count / (time.perf_counter() - start)
+
+async def max_loop_stall(hash_async, count: int) -> float:
+    """Returns the longest time a 1 ms timer of the event loop was late
+    while count passwords were hashed with hash_async."""
+    stall = 0.0
+    done = False
+
+    async def tick():
+        nonlocal stall
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            stall = max(stall, time.perf_counter() - start - 0.001)
+
+    ticker = asyncio.create_task(tick())
+    await asyncio.gather(*[hash_async(f"password{i}") for i in range(count)])
+    done = True
+    await ticker
+    return stall
+
+def main():
+    """Prints the hashing rates and the event loop stalls."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    workers = [int(arg) for arg in sys.argv[2:]] or sorted({1, os.cpu_count() or 1})
+    spawn = multiprocessing.get_context("spawn")
+
+    print(f"{count} passwords, scrypt r={config.PASSWORD_SCRYPT_R} p={config.PASSWORD_SCRYPT_P}")
+    print(f"  {'N':>7} {'ms/hash':>8} {'in process':>11}"
+          + "".join(f" {f'{worker} workers':>11}" for worker in workers) + "  (hashes/s)")
+    for n in WORK_FACTORS:
+        single = hashes_per_second(None, max(1, count // 4), n)
+        rates = []
+        for worker_count in workers:
+            with ProcessPoolExecutor(worker_count, mp_context=spawn) as executor:
+                hashes_per_second(executor, worker_count, n)  # Starts the processes.
+                rates.append(hashes_per_second(executor, count, n))
+        print(f"  {n:>7} {1000 / single:>8.1f} {single:>11.1f}"
+              + "".join(f" {rate:>11.1f}" for rate in rates))
+
+    def in_thread(password):
+        return asyncio.to_thread(database.hash_password, password, config.PASSWORD_SCRYPT_N,
+                                 config.PASSWORD_SCRYPT_R, config.PASSWORD_SCRYPT_P)
+
+    def in_process(password):
+        return asyncio.wrap_future(database.submit_password_hash(password))
+
+    database.hash_passwords(["warm-up"] * config.PASSWORD_HASH_WORKERS)
+    print(f"Longest event loop stall while hashing {count} passwords with "
+          f"N={config.PASSWORD_SCRYPT_N}:")
+    for name, hash_async in (("threads", in_thread), ("worker processes", in_process)):
+        stall = asyncio.run(max_loop_stall(hash_async, count))
+        print(f"  {name:>16}: {stall * 1000:8.1f} ms")
+    database.stop_password_hasher()
+
+if __name__ == "__main__":
+    main()
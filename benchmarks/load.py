@@ -0,0 +1,208 @@
+"""Load test of every route of the application through an in-process ASGI client.
+
+Usage: python -m benchmarks.load [--users N] [--posts N] [--requests N] [--concurrency N]
+                                 [--output FILE]
+
+The database is a fresh SQLite file in a temporary directory unless DATABASE_URL is set.
+It is seeded with the given numbers of users and posts, then every route is requested
+concurrently and throughput and p50/p95/p99 latency per route are printed as JSON,
+which can be saved with --output and compared across commits.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from itertools import count
+from pathlib import Path
+from fastapi.routing import APIRoute
+
+def parse_args():
+    """Returns the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000, help="number of seeded users")
+    parser.add_argument("--posts", type=int, default=10000, help="number of seeded posts")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=20, help="requests in flight")
+    parser.add_argument("--output", type=Path, help="file to write the JSON report to")
+    args = parser.parse_args()
+    # The edit routes change the first users and posts, one per request, and the delete
+    # routes remove the last ones, so the two ranges must not overlap.
+    if 2 * args.requests > min(args.users, args.posts):
+        parser.error("--requests must be at most half of --users and --posts")
+    return args
+
+def seed(database, user_count: int, post_count: int):
+    """Creates the schema and fills it with users and posts."""
+    database.init_db()
+    with database.get_session() as db:
+        database.import_users(db, ({"username": f"user{i}",
+                                    "email": f"user{i}@example.com",
+                                    "password": f"password{i}"}
+                                   for i in range(1, user_count + 1)))
+        database.import_posts(db, ({"title": f"Post {i}",
+                                    "content": f"Content of post {i}",
+                                    "user_id": i % user_count + 1}
+                                   for i in range(1, post_count + 1)))
+
+def get_routes(user_count: int, post_count: int):
+    """Returns (name, method, path, function making the URL and request options)
+    for the requests of the load test; path is the route the request is sent to.
+    Write routes get distinct ids, so each delete hits a row that still exists
+    and each edit sends the current version (1) of a row that was not edited yet."""
+    unique = count(1)
+    # Users and posts are edited from the start and deleted from the end.
+    edited_user_ids = count(1)
+    edited_post_ids = count(1)
+    deleted_user_ids = iter(range(user_count, 0, -1))
+    deleted_post_ids = iter(range(post_count, 0, -1))
+
+    def get(url):
+        return lambda: (url, {})
+
+    def new_user():
+        number = next(unique)
+        return "/add-user", {"data": {"username": f"new{number}",
+                                      "email": f"new{number}@example.com",
+                                      "password": "password"}}
+
+    def edited_user():
+        number = next(unique)
+        return f"/edit-user/{next(edited_user_ids)}", {"data": {
+            "version": "1", "username": f"edited{number}",
+            "email": f"edited{number}@example.com", "password": "password"}}
+
+    def imported_users():
+        number = next(unique)
+        record = {"username": f"imported{number}", "email": f"imported{number}@example.com",
+                  "password": "password"}
+        return "/import/users", {"files": {"file": ("users.jsonl", json.dumps(record) + "\n")}}
+
+    def imported_posts():
+        lines = "".join(json.dumps({"title": f"Imported post {i}", "content": "Imported content",
+                                    "user_id": 1}) + "\n" for i in range(10))
+        return "/import/posts", {"files": {"file": ("posts.jsonl", lines)}}
+
+    return [
+        ("GET /", "GET", "/", get("/")),
+        ("GET /?users_after", "GET", "/", get(f"/?users_after={user_count // 2}")),
+        ("GET /stream", "GET", "/stream", get("/stream")),
+        ("GET /add-user", "GET", "/add-user", get("/add-user")),
+        ("GET /add-post", "GET", "/add-post", get("/add-post")),
+        ("GET /edit-user/{id}", "GET", "/edit-user/{user_id}", get("/edit-user/1")),
+        ("GET /edit-post/{id}", "GET", "/edit-post/{post_id}", get("/edit-post/1")),
+        ("GET /search", "GET", "/search", get("/search?q=content")),
+        ("GET /import", "GET", "/import", get("/import")),
+        ("GET /export/users", "GET", "/export/{table}", get("/export/users")),
+        ("GET /export/posts", "GET", "/export/{table}", get("/export/posts?format=jsonl")),
+        ("GET /api/users", "GET", "/api/users", get("/api/users")),
+        ("GET /api/posts", "GET", "/api/posts", get("/api/posts")),
+        ("GET /api/users/{id}/posts", "GET", "/api/users/{user_id}/posts",
+         get("/api/users/1/posts")),
+        ("GET /stats", "GET", "/stats", get("/stats")),
+        ("GET /error", "GET", "/error", get("/error?message=benchmark")),
+        ("GET /cache-stats", "GET", "/cache-stats", get("/cache-stats")),
+        ("GET /pool-stats", "GET", "/pool-stats", get("/pool-stats")),
+        ("GET /metrics", "GET", "/metrics", get("/metrics")),
+        ("POST /add-user", "POST", "/add-user", new_user),
+        ("POST /add-post", "POST", "/add-post",
+         lambda: ("/add-post", {"data": {"title": "New post", "content": "New content",
+                                         "user_id": "1"}})),
+        ("POST /edit-user/{id}", "POST", "/edit-user/{user_id}", edited_user),
+        ("POST /edit-post/{id}", "POST", "/edit-post/{post_id}",
+         lambda: (f"/edit-post/{next(edited_post_ids)}",
+                  {"data": {"version": "1", "title": "Edited post",
+                            "content": "Edited content", "user_id": "1"}})),
+        ("POST /import/users", "POST", "/import/{table}", imported_users),
+        ("POST /import/posts", "POST", "/import/{table}", imported_posts),
+        ("POST /delete-post/{id}", "POST", "/delete-post/{post_id}",
+         lambda: (f"/delete-post/{next(deleted_post_ids)}", {})),
+        ("POST /delete-user/{id}", "POST", "/delete-user/{user_id}",
+         lambda: (f"/delete-user/{next(deleted_user_ids)}", {})),
+    ]
+
+def select_routes(app, routes):
+    """Returns the requests of routes that the application serves, and fails if
+    the application has a route without a request, so new routes are not left out."""
+    served = {(method, route.path) for route in app.routes if isinstance(route, APIRoute)
+              for method in route.methods}
+    missing = served - {(method, path) for _, method, path, _ in routes}
+    if missing:
+        raise SystemExit("No load test requests for the routes "
+                         + ", ".join(f"{method} {path}" for method, path in sorted(missing)))
+    return [request for request in routes if (request[1], request[2]) in served]
+
+async def run_route(client, method: str, make_request, request_count: int, concurrency: int):
+    """Sends requests to a route from concurrent workers and returns the statistics."""
+    latencies = []
+    errors = 0
+    remaining = iter(range(request_count))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            url, options = make_request()
+            start = time.perf_counter()
+            response = await client.request(method, url, **options)
+            latencies.append(time.perf_counter() - start)
+            location = response.headers.get("location", "")
+            if response.status_code >= 400 or location.startswith("/error"):
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": request_count,
+        "errors": errors,
+        "throughput_rps": round(request_count / elapsed, 1),
+        "p50_ms": round(percentiles[49] * 1000, 2),
+        "p95_ms": round(percentiles[94] * 1000, 2),
+        "p99_ms": round(percentiles[98] * 1000, 2),
+    }
+
+async def run(args):
+    """Seeds the database, requests every route and returns the report."""
+    # The application reads its configuration on import, so it is imported here.
+    import httpx # pylint: disable=import-outside-toplevel
+    import config # pylint: disable=import-outside-toplevel
+    import database # pylint: disable=import-outside-toplevel
+    import main # pylint: disable=import-outside-toplevel
+
+    seed(database, args.users, args.posts)
+
+    report = {
+        "config": {"users": args.users, "posts": args.posts, "requests": args.requests,
+                   "concurrency": args.concurrency, "async": config.DATABASE_ASYNC,
+                   "database": config.DATABASE_URL.split("://")[0]},
+        "routes": {},
+    }
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        for name, method, _, make_request in select_routes(main.app,
+                                                           get_routes(args.users, args.posts)):
+            report["routes"][name] = await run_route(client, method, make_request,
+                                                     args.requests, args.concurrency)
+            print(name, report["routes"][name], file=sys.stderr)
+    return report
+
+def main():
+    """Runs the load test and prints the report."""
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{directory}/benchmark.db")
+        report = asyncio.run(run(args))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+if __name__ == "__main__":
+    main()
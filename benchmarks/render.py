@@ -0,0 +1,46 @@
+"""Compares rendering the users table with str.format and += against the compiled templates.
+
+Usage: python -m benchmarks.render [rows] [repeats]
+"""
+
+import sys
+import timeit
+from collections import namedtuple
+from pathlib import Path
+from rendering import load_templates
+
+UserRow = namedtuple("UserRow", "id username email")
+
+USER_ITEM = """
+<tr>
+    <th scope="row">{0}</th>
+    <td>{1}</td>
+    <td>{2}</td>
+    <td><form method="get" action="/edit-user/{0}"><button type="submit">Edit</button></form></td>
+    <td><form method="post" action="/delete-user/{0}"><button type="submit">Delete</button></form></td>
+</tr>
+"""
+
+def render_with_format(rows):
+    """Renders the rows the way the pages did before the templates."""
+    user_items = ""
+    for user in rows:
+        user_items += USER_ITEM.format(user.id, user.username, user.email) + "\n"
+    return user_items
+
+def main():
+    """Prints the time per render of both approaches."""
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    rows = [UserRow(i, f"User {i}", f"user{i}@example.com")
+            for i in range(1, row_count + 1)]
+    user_row = load_templates(Path(__file__).parent.parent / "templates")["user_row"]
+
+    for name, render in (("format and +=", lambda: render_with_format(rows)),
+                         ("compiled template", lambda: user_row.render_rows(rows))):
+        seconds = min(timeit.repeat(render, number=1, repeat=repeats))
+        print(f"{name:>18}: {seconds * 1000:8.2f} ms for {row_count} rows")
+
+if __name__ == "__main__":
+    main()
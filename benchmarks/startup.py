@@ -0,0 +1,38 @@
+"""Measures the cold start of the application: a new interpreter importing main:app.
+
+Usage: python -m benchmarks.startup [repeats] [directory]
+
+The directory defaults to the repository root, so another checkout can be measured
+for comparison. DATABASE_URL is passed on to the child processes.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+def measure(directory: Path, repeats: int):
+    """Returns the wall-clock times of importing main in new interpreters."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import main; main.app"],
+                       cwd=directory, env=os.environ, check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+def main():
+    """Prints the median and the spread of the cold start time."""
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    directory = Path(sys.argv[2]) if len(sys.argv) > 2 else Path(__file__).parent.parent
+
+    times = measure(directory, repeats)
+    print(f"cold start of main:app in {directory}: "
+          f"median {statistics.median(times) * 1000:.1f} ms, "
+          f"min {min(times) * 1000:.1f} ms, max {max(times) * 1000:.1f} ms "
+          f"over {repeats} runs")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Command line tools for the database of lab 9.
+
+Usage: python cli.py <command>
+"""
+
+import argparse
+import sys
+import time
+import config
+import database
+import export
+import replication
+
+def init_db(_args):
+    """Creates the tables and indexes of the model."""
+    database.init_db()
+    print("Database initialized")
+    return 0
+
+def migrate(_args):
+    """Creates missing tables and indexes."""
+    created_indexes = database.migrate()
+    print("Created indexes: " + (", ".join(created_indexes) or "none"))
+    return 0
+
+def check_plans(_args):
+    """Fails if a per-user query on posts does not use an index."""
+    with database.get_session() as db:
+        problems = database.check_query_plans(db)
+    for problem in problems:
+        print(problem)
+    print("Query plans: " + ("failed" if problems else "ok"))
+    return 1 if problems else 0
+
+def rebuild_post_counts(_args):
+    """Recounts the posts of every user."""
+    with database.get_session() as db:
+        fixed = database.rebuild_post_counts(db)
+    print(f"Fixed post counts: {fixed}")
+    return 0
+
+def check_post_counts(_args):
+    """Fails if a stored post count does not match the posts table."""
+    with database.get_session() as db:
+        mismatches = database.check_post_counts(db)
+    for user_id, stored, actual in mismatches:
+        print(f"user {user_id}: stored {stored}, actual {actual}")
+    print("Post counts: " + ("failed" if mismatches else "ok"))
+    return 1 if mismatches else 0
+
+def rehash_passwords(_args):
+    """Hashes the passwords stored in plaintext, using all CPU cores."""
+    with database.get_session() as db:
+        hashed = database.rehash_passwords(db)
+    database.stop_password_hasher()
+    print(f"Hashed passwords: {hashed}")
+    return 0
+
+def replicate(args):
+    """Copies the SQLite primary database into the replica files, like a lagging replica."""
+    primary_path = replication.get_sqlite_path(config.DATABASE_URL)
+    replica_paths = [replication.get_sqlite_path(url) for url in config.REPLICA_URLS]
+    if not replica_paths:
+        print("REPLICA_URLS is not set")
+        return 1
+    replication.copy_database(primary_path, replica_paths)
+    print(f"Copied {primary_path} to {', '.join(replica_paths)}")
+    if args.once:
+        return 0
+
+    try:
+        while True:
+            time.sleep(args.interval)
+            replication.copy_database(primary_path, replica_paths)
+    except KeyboardInterrupt:
+        return 0
+
+def write_export(args, output):
+    """Writes the export file of a table to a binary file object."""
+    with database.get_session() as db:
+        for chunk in export.export_rows(
+                database.API_FIELDS[args.table],
+                database.iter_partitions(db, database.select_export_rows(args.table)),
+                args.format, args.gzip):
+            output.write(chunk)
+
+def export_table(args):
+    """Writes all users or posts as a CSV or JSON Lines file."""
+    if args.output:
+        with open(args.output, "wb") as output:
+            write_export(args, output)
+    else:
+        write_export(args, sys.stdout.buffer)
+    return 0
+
+def main(argv=None):
+    """Runs the command given in the arguments and returns the exit code."""
+    parser = argparse.ArgumentParser(description="Database tools for lab 9.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("init-db", help=init_db.__doc__).set_defaults(func=init_db)
+    commands.add_parser("migrate", help=migrate.__doc__).set_defaults(func=migrate)
+    commands.add_parser("check-plans", help=check_plans.__doc__).set_defaults(func=check_plans)
+    commands.add_parser("rebuild-post-counts",
+                        help=rebuild_post_counts.__doc__).set_defaults(func=rebuild_post_counts)
+    commands.add_parser("check-post-counts",
+                        help=check_post_counts.__doc__).set_defaults(func=check_post_counts)
+    commands.add_parser("rehash-passwords",
+                        help=rehash_passwords.__doc__).set_defaults(func=rehash_passwords)
+    replicate_parser = commands.add_parser("replicate", help=replicate.__doc__)
+    replicate_parser.add_argument("--interval", type=float, default=1,
+                                  help="seconds between copies")
+    replicate_parser.add_argument("--once", action="store_true", help="copy once and exit")
+    replicate_parser.set_defaults(func=replicate)
+    export_parser = commands.add_parser("export", help=export_table.__doc__)
+    export_parser.add_argument("table", choices=["users", "posts"])
+    export_parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    export_parser.add_argument("--gzip", action="store_true", help="compress the file with gzip")
+    export_parser.add_argument("--output", help="file to write to instead of standard output")
+    export_parser.set_defaults(func=export_table)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""This module compresses responses with gzip, brotli or zstd, as the client accepts.
+
+gzip is always available. brotli needs the brotli package, and zstd needs Python 3.14
+or the zstandard package; encodings without their package are left out.
+"""
+
+import asyncio
+import zlib
+import config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/javascript",
+                      "image/svg+xml")
+
+# Bodies this large are compressed in a worker thread instead of the event loop.
+THREAD_MIN_SIZE = 1024 * 1024
+
+def _gzip(data: bytes, level: int | None) -> bytes:
+    """Compresses data with gzip."""
+    # wbits=31 writes the gzip header and trailer around the deflate stream.
+    compressor = zlib.compressobj(config.GZIP_LEVEL if level is None else level,
+                                  zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+def _brotli(data: bytes, level: int | None) -> bytes:
+    """Compresses data with brotli."""
+    return brotli.compress(data, quality=config.BROTLI_QUALITY if level is None else level)
+
+def _zstd(data: bytes, level: int | None) -> bytes:
+    """Compresses data with zstd."""
+    return zstd.compress(data, config.ZSTD_LEVEL if level is None else level)
+
+COMPRESSORS = {"gzip": _gzip}
+if brotli is not None:
+    COMPRESSORS["br"] = _brotli
+if zstd is not None:
+    COMPRESSORS["zstd"] = _zstd
+
+def available(encodings: list[str]) -> list[str]:
+    """Returns the encodings of a list that can be used here, in the same order."""
+    return [encoding for encoding in encodings if encoding in COMPRESSORS]
+
+def compress(data: bytes, encoding: str, level: int | None = None) -> bytes:
+    """Compresses data with an encoding, at the configured level unless one is given."""
+    return COMPRESSORS[encoding](data, level)
+
+async def compress_async(data: bytes, encoding: str) -> bytes:
+    """Compresses data with an encoding, in a worker thread if the data is large."""
+    if len(data) >= THREAD_MIN_SIZE:
+        return await asyncio.to_thread(compress, data, encoding)
+    return compress(data, encoding)
+
+def negotiate(accept_encoding: str | None, encodings: list[str]) -> str | None:
+    """Returns the encoding with the highest quality value in an Accept-Encoding header,
+    preferring the earlier encodings of the list on ties, or None if the client should get
+    the response uncompressed."""
+    if not accept_encoding or not encodings:
+        return None
+    qualities = {}
+    for item in accept_encoding.lower().split(","):
+        name, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            qualities[name] = quality
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def is_compressible(content_type: str) -> bool:
+    """Checks whether responses of a media type are worth compressing."""
+    media_type = content_type.partition(";")[0].strip().lower()
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+def weak_etag(etag: str) -> str:
+    """Returns an ETag as a weak one, since a compressed body differs byte by byte
+    from the uncompressed one it stands for."""
+    return etag if etag.startswith("W/") else "W/" + etag
+
+class EncodedBody:
+    """A response body that keeps its compressed variants, so a cached page is
+    compressed once per encoding and not on every request."""
+
+    def __init__(self, content: bytes):
+        self.content = content
+        self._variants = {}
+
+    async def encode(self, encoding: str | None) -> bytes:
+        """Returns the body compressed with an encoding, or as it is for None."""
+        if encoding is None:
+            return self.content
+        variant = self._variants.get(encoding)
+        if variant is None:
+            variant = await compress_async(self.content, encoding)
+            self._variants[encoding] = variant
+        return variant
+
+class CompressionMiddleware:
+    """ASGI middleware that compresses text responses the client accepts compressed.
+    Responses that are small, already encoded or streamed in several parts
+    are sent as they are."""
+
+    def __init__(self, app, encodings: list[str], min_size: int):
+        self.app = app
+        self.encodings = available(encodings)
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = next((value.decode("latin-1") for name, value in scope["headers"]
+                                if name == b"accept-encoding"), None)
+        encoding = negotiate(accept_encoding, self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
+            response_start, start = start, None
+            body = message.get("body", b"")
+            headers = {name.lower(): value for name, value in response_start.get("headers", [])}
+            if (message.get("more_body", False) or len(body) < self.min_size
+                    or b"content-encoding" in headers
+                    or not is_compressible(headers.get(b"content-type", b"").decode("latin-1"))):
+                await send(response_start)
+                await send(message)
+                return
+
+            body = await compress_async(body, encoding)
+            response_headers = []
+            for name, value in response_start["headers"]:
+                if name.lower() == b"content-length":
+                    continue
+                if name.lower() == b"etag":
+                    value = weak_etag(value.decode("latin-1")).encode("latin-1")
+                response_headers.append((name, value))
+            response_headers += [(b"content-encoding", encoding.encode("latin-1")),
+                                 (b"content-length", str(len(body)).encode("latin-1")),
+                                 (b"vary", b"Accept-Encoding")]
+            await send({**response_start, "headers": response_headers})
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,94 @@
+"""This module turns rows into CSV or JSON Lines files that are written chunk by chunk.
+
+Rows come in lists (partitions of a server-side cursor), and every list becomes one chunk
+of bytes, so memory use depends on the chunk size and not on the size of the table.
+"""
+
+import csv
+import io
+import zlib
+import orjson
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+}
+
+class _CSVChunks:
+    """Formats lists of rows as CSV, starting with a header line."""
+
+    def __init__(self, fields):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._writer.writerow(fields)
+
+    def format(self, rows) -> bytes:
+        """Returns the rows as CSV lines, preceded by the header on the first call."""
+        self._writer.writerows(rows)
+        text = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return text.encode("utf-8")
+
+class _JSONLinesChunks:
+    """Formats lists of rows as JSON objects, one per line."""
+
+    def __init__(self, fields):
+        self._fields = fields
+
+    def format(self, rows) -> bytes:
+        """Returns the rows as JSON Lines."""
+        fields = self._fields
+        return b"".join([orjson.dumps(dict(zip(fields, row)), option=orjson.OPT_APPEND_NEWLINE)
+                         for row in rows])
+
+FORMATTERS = {
+    "csv": _CSVChunks,
+    "jsonl": _JSONLinesChunks,
+}
+
+class Exporter:
+    """Formats lists of rows in a file format and compresses them with gzip if asked."""
+
+    def __init__(self, fields, file_format: str, compress: bool = False):
+        if file_format not in FORMATTERS:
+            raise ValueError(f"Unknown file format {file_format}")
+        self._formatter = FORMATTERS[file_format](list(fields))
+        # wbits=31 writes the gzip header and trailer around the deflate stream.
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def chunk(self, rows) -> bytes:
+        """Returns the next chunk of the file, with the given rows."""
+        data = self._formatter.format(rows)
+        if self._compressor is not None:
+            return self._compressor.compress(data)
+        return data
+
+    def end(self) -> bytes:
+        """Returns the end of the file."""
+        if self._compressor is not None:
+            return self._compressor.flush()
+        return b""
+
+def get_file_name(table_name: str, file_format: str, compress: bool = False) -> str:
+    """Returns the name of an exported file."""
+    return f"{table_name}.{file_format}" + (".gz" if compress else "")
+
+def export_rows(fields, partitions, file_format: str, compress: bool = False):
+    """Yields the bytes of a file with the rows of an iterable of row lists."""
+    exporter = Exporter(fields, file_format, compress)
+    # The first chunk holds the CSV header, which is written even if there are no rows.
+    yield exporter.chunk([])
+    for rows in partitions:
+        if chunk := exporter.chunk(rows):
+            yield chunk
+    yield exporter.end()
+
+async def export_rows_async(fields, partitions, file_format: str, compress: bool = False):
+    """Yields the bytes of a file with the rows of an async iterable of row lists."""
+    exporter = Exporter(fields, file_format, compress)
+    yield exporter.chunk([])
+    async for rows in partitions:
+        if chunk := exporter.chunk(rows):
+            yield chunk
+    yield exporter.end()
@@ -1,205 +1,363 @@
 """A program for lab 9, demonstrating the usage of SQLAlchemy ORM."""
 
-from typing import Annotated
-from fastapi import FastAPI, Form, status
-from fastapi.responses import HTMLResponse, RedirectResponse
+import asyncio
+import csv
+import io
+import json
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Annotated, Literal
+from urllib.parse import urlencode
+from fastapi import Cookie, Depends, FastAPI, Form, Header, Query, Response, UploadFile, status
+from fastapi.responses import (HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse,
+                               StreamingResponse)
+import orjson
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+import async_database
+import config
+import content_encoding
 import database
+import export
+import metrics
+import rendering
+import replication
+from page_cache import PageCache
+from rendering import Markup, load_templates
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Creates the database engine when the application starts and disposes of it on shutdown.
+    The schema is not touched here; it is created with "python cli.py init-db".
+    Rows queued for the write batcher are flushed before the engine is disposed of."""
+    if config.WRITE_BATCHING:
+        database.get_write_batcher()
+    replicator = None
+    if config.REPLICATION_STUB_INTERVAL:
+        replicator = replication.StubReplicator(config.DATABASE_URL, config.REPLICA_URLS,
+                                                config.REPLICATION_STUB_INTERVAL)
+        replicator.start()
+    if config.DATABASE_ASYNC:
+        async_engine = async_database.get_engine()
+        yield
+        await asyncio.to_thread(database.stop_write_batcher)
+        await asyncio.to_thread(database.stop_password_hasher)
+        await async_database.dispose_replicas()
+        await async_engine.dispose()
+        # The synchronous engine is created if an import ran.
+        await asyncio.to_thread(database.dispose_engine)
+    else:
+        engine = database.get_engine()
+        yield
+        await asyncio.to_thread(database.stop_write_batcher)
+        await asyncio.to_thread(database.stop_password_hasher)
+        database.dispose_replicas()
+        engine.dispose()
+    if replicator is not None:
+        replicator.stop()
 
-@app.get("/")
-def read_index():
-    """Returns a page containing tables with info about users and posts."""
-    html = """
-<!DOCTYPE html>
-<html>
-    <head>
-        <title>Main Page</title>
-    </head>
-    <body>
-        <h2>Users</h2>
-        <form method="get" action="/add-user"><button type="submit">Add</button></form>
-        <table>
-            <thead>
-                <tr>
-                    <th scope="col">ID</th>
-                    <th scope="col">Username</th>
-                    <th scope="col">Email</th>
-                    <th scope="col">Password</th>
-                    <th scope="col">Edit</th>
-                    <th scope="col">Delete</th>
-                </tr>
-            </thead>
-            <tbody>
-                {0}
-            </tbody>
-        </table>
-        <h2>Posts</h2>
-        <form method="get" action="/add-post"><button type="submit">Add</button></form>
-        <table>
-            <thead>
-                <tr>
-                    <th scope="col">ID</th>
-                    <th scope="col">Title</th>
-                    <th scope="col">Content</th>
-                    <th scope="col">User ID</th>
-                    <th scope="col">Edit</th>
-                    <th scope="col">Delete</th>
-                </tr>
-            </thead>
-            <tbody>
-                {1}
-            </tbody>
-        </table>
-    </body>
-</html>
-"""
-
-    user_item = """
-<tr>
-    <th scope="row">{0}</th>
-    <td>{1}</td>
-    <td>{2}</td>
-    <td>{3}</td>
-    <td><form method="get" action="/edit-user/{0}"><button type="submit">Edit</button></form></td>
-    <td><form method="post" action="/delete-user/{0}"><button type="submit">Delete</button></form></td>
-</tr>
-"""
-
-    post_item = """
-<tr>
-    <th scope="row">{0}</th>
-    <td>{1}</td>
-    <td>{2}</td>
-    <td>{3}</td>
-    <td><form method="get" action="/edit-post/{0}"><button type="submit">Edit</button></form></td>
-    <td><form method="post" action="/delete-post/{0}"><button type="submit">Delete</button></form></td>
-</tr>
-"""
+app = FastAPI(lifespan=lifespan)
 
-    try:
-        users = database.get_users()
-        posts = database.get_posts()
+COMPRESSION_ENCODINGS = content_encoding.available(config.COMPRESSION_ENCODINGS)
+
+if COMPRESSION_ENCODINGS:
+    app.add_middleware(content_encoding.CompressionMiddleware,
+                       encodings=COMPRESSION_ENCODINGS, min_size=config.COMPRESSION_MIN_SIZE)
+
+if config.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    rendering.set_render_observer(metrics.observe_render)
+
+get_db = async_database.get_db if config.DATABASE_ASYNC else database.get_db
+
+DbSession = Annotated[Session | AsyncSession, Depends(get_db)]
+
+ReadPrimary = Annotated[str | None, Cookie()]
+
+def get_read_db(read_primary: ReadPrimary = None):
+    """Yields a session on a replica for a read-only request, or on the primary
+    while the client is pinned to it. Intended for use with FastAPI Depends."""
+    with database.get_read_session(use_primary=read_primary is not None) as db:
+        yield db
+
+async def get_async_read_db(read_primary: ReadPrimary = None):
+    """Yields an async session like get_read_db."""
+    async with async_database.get_read_session(use_primary=read_primary is not None) as db:
+        yield db
+
+ReadDbSession = Annotated[Session | AsyncSession,
+                          Depends(get_async_read_db if config.DATABASE_ASYNC else get_read_db)]
+
+class PinReadsToPrimaryMiddleware:
+    """ASGI middleware that sends the reads of a client to the primary for a while after
+    it writes, so it sees its own changes before they reach the replicas.
+    Every response to a request other than GET and HEAD sets a short-lived cookie."""
+
+    def __init__(self, app):
+        self.app = app
+        self.cookie = (f"read_primary=1; Max-Age={config.READ_YOUR_WRITES_SECONDS}; "
+                       "Path=/; HttpOnly; SameSite=lax").encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"set-cookie", self.cookie)]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+if config.REPLICA_URLS and config.READ_YOUR_WRITES_SECONDS > 0:
+    app.add_middleware(PinReadsToPrimaryMiddleware)
+
+PageLimit = Annotated[int, Query(ge=1, le=config.MAX_PAGE_SIZE)]
+
+IfNoneMatch = Annotated[str | None, Header()]
+
+AcceptEncoding = Annotated[str | None, Header()]
+
+templates = load_templates(Path(__file__).parent / "templates")
+
+pages = PageCache(config.PAGE_CACHE_TTL, config.PAGE_CACHE_SIZE)
+database.on_tables_changed(pages.clear)
 
-        user_items = ""
-        for user in users:
-            user_items += user_item.format(user.id, user.username, user.email, user.password) + "\n"
+class ORJSONResponse(JSONResponse):
+    """A JSON response serialized with orjson."""
 
-        post_items = ""
-        for post in posts:
-            post_items += post_item.format(post.id, post.title, post.content, post.user_id) + "\n"
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
 
-        return HTMLResponse(content=html.format(user_items, post_items))
+async def page_etag(db, *table_names: str) -> str:
+    """Returns the ETag of a page showing the given tables."""
+    return f'"{await async_database.run(db, database.get_table_version, *table_names)}"'
+
+def is_not_modified(if_none_match: str | None, etag: str) -> bool:
+    """Checks whether an If-None-Match header matches the current ETag of a page."""
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+def page_headers(etag: str, db=None) -> dict[str, str]:
+    """Returns the headers that make browsers revalidate a page with its ETag on every load.
+    A page read from a replica gets no ETag, since the replica may not have the changes
+    the current table versions stand for."""
+    if db is not None and database.is_replica(db):
+        return {}
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+def cached_page(content: str | None, etag: str, db=None) -> Response:
+    """Returns a page with its ETag headers, or an empty 304 response if content is None."""
+    if content is None:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                        headers=page_headers(etag))
+    return HTMLResponse(content=content, headers=page_headers(etag, db))
+
+async def encoded_page(body: content_encoding.EncodedBody, headers: dict[str, str],
+                       accept_encoding: str | None) -> HTMLResponse:
+    """Returns a page compressed with the encoding the client prefers.
+    The compressed variants are kept in the body, so a cached page is compressed only once."""
+    if not COMPRESSION_ENCODINGS:
+        return HTMLResponse(content=body.content, headers=headers)
+    headers = {**headers, "Vary": "Accept-Encoding"}
+    encoding = None
+    if len(body.content) >= config.COMPRESSION_MIN_SIZE:
+        encoding = content_encoding.negotiate(accept_encoding, COMPRESSION_ENCODINGS)
+    if encoding is None:
+        return HTMLResponse(content=body.content, headers=headers)
+    headers["Content-Encoding"] = encoding
+    if "ETag" in headers:
+        headers["ETag"] = content_encoding.weak_etag(headers["ETag"])
+    return HTMLResponse(content=await body.encode(encoding), headers=headers)
+
+async def render_shared(key, use_primary: bool, render, *args):
+    """Calls render(db, *args) with a new read session. Concurrent calls with the same key
+    share one call, and its result is reused until PAGE_CACHE_TTL passes or a table changes.
+    Clients pinned to the primary get a call of their own, so they see their own changes."""
+    if use_primary:
+        return await async_database.run_read(render, *args, use_primary=True)
+    return await pages.get(key, lambda: async_database.run_read(render, *args))
+
+def page_links(page: database.Page, param: str, query: dict) -> Markup:
+    """Returns links to the previous and the next page of a table,
+    keeping the other query parameters."""
+    links = []
+    if page.prev_after is not None:
+        prev_query = {**query, param: page.prev_after} if page.prev_after else query
+        links.append(f'<a href="/?{urlencode(prev_query)}">Previous</a>')
+    if page.next_after is not None:
+        links.append(f'<a href="/?{urlencode({**query, param: page.next_after})}">Next</a>')
+    return Markup("<nav>" + " ".join(links) + "</nav>")
+
+def user_options(users, selected_user_id: int | None = None) -> Markup:
+    """Returns the options of a select element for choosing a user."""
+    return Markup("".join([
+        templates["selected_user_option" if user.id == selected_user_id else "user_option"]
+        .render_row(user)
+        for user in users]))
+
+def render_user_options(db, selected_user_id: int | None = None) -> Markup:
+    """Returns the options for choosing a user, read with a given session."""
+    return user_options(database.get_user_directory(db), selected_user_id)
+
+def render_index(db, users_after: int | None, posts_after: int | None, limit: int,
+                 etag: str) -> tuple[content_encoding.EncodedBody, dict[str, str]]:
+    """Returns the body and the headers of the index page."""
+    users = database.get_users_page(db, users_after, limit)
+    posts = database.get_posts_page(db, posts_after, limit)
+
+    query = {"limit": limit} if limit != config.PAGE_SIZE else {}
+    user_links = page_links(users, "users_after",
+                            {**query, "posts_after": posts_after} if posts_after else query)
+    post_links = page_links(posts, "posts_after",
+                            {**query, "users_after": users_after} if users_after else query)
+
+    content = templates["index"].render(
+        user_rows=templates["user_row"].render_rows(users.items),
+        user_links=user_links,
+        post_rows=templates["post_row"].render_rows(posts.items),
+        post_links=post_links)
+    return content_encoding.EncodedBody(content.encode("utf-8")), page_headers(etag, db)
+
+@app.get("/")
+async def read_index(db: ReadDbSession,
+                     users_after: int | None = None,
+                     posts_after: int | None = None,
+                     limit: PageLimit = config.PAGE_SIZE,
+                     if_none_match: IfNoneMatch = None,
+                     accept_encoding: AcceptEncoding = None,
+                     read_primary: ReadPrimary = None):
+    """Returns a page containing tables with info about users and posts.
+    A request with the current ETag is answered with 304 after reading only the table
+    versions, and concurrent requests for the same page share one rendering."""
+    try:
+        etag = await page_etag(db, "users", "posts")
+        if is_not_modified(if_none_match, etag):
+            return cached_page(None, etag)
+
+        # The ETag is part of the key, so a change committed by another process
+        # is not hidden by a page cached here.
+        body, headers = await render_shared(("index", users_after, posts_after, limit, etag),
+                                            read_primary is not None, render_index,
+                                            users_after, posts_after, limit, etag)
+        return await encoded_page(body, headers, accept_encoding)
     except SQLAlchemyError as sqlalchemy_error:
-        database.rollback()
         return RedirectResponse(f"/error?message={sqlalchemy_error}",
                                 status_code=status.HTTP_302_FOUND)
 
+def stream_index(use_primary: bool):
+    """Yields the page with all users and posts, rendering rows as they are fetched.
+    Every fetched partition of rows becomes one chunk, so the response does not
+    pass each row through the threadpool on its own."""
+    with database.get_read_session(use_primary) as db:
+        user_rows = map(templates["user_row"].render_rows,
+                        database.iter_partitions(db, database.select_user_rows()))
+        post_rows = map(templates["post_row"].render_rows,
+                        database.iter_partitions(db, database.select_post_rows()))
+        yield from templates["stream"].render_chunks(user_rows=user_rows, post_rows=post_rows)
+
+async def render_rows_async(template_name: str, partitions):
+    """Renders every list of rows of an async iterable with a row template, one chunk per list."""
+    template = templates[template_name]
+    async for rows in partitions:
+        yield template.render_rows(rows)
+
+async def stream_index_async(use_primary: bool):
+    """Yields the page with all users and posts, rendering rows as they are fetched."""
+    async with async_database.get_read_session(use_primary) as db:
+        user_rows = async_database.iter_partitions(db, database.select_user_rows())
+        post_rows = async_database.iter_partitions(db, database.select_post_rows())
+        async for chunk in templates["stream"].render_chunks_async(
+                user_rows=render_rows_async("user_row", user_rows),
+                post_rows=render_rows_async("post_row", post_rows)):
+            yield chunk
+
+@app.get("/stream")
+async def read_stream(read_primary: ReadPrimary = None):
+    """Returns a page containing all users and posts. The page is streamed, so memory use
+    is bounded by the fetch chunk size instead of the table size."""
+    use_primary = read_primary is not None
+    if config.DATABASE_ASYNC:
+        return StreamingResponse(stream_index_async(use_primary), media_type="text/html")
+    return StreamingResponse(stream_index(use_primary), media_type="text/html")
+
 @app.get("/add-user")
-def read_add_user():
+async def read_add_user():
     """Returns a page for adding a new user."""
-    html = """
-<!DOCTYPE html>
-<html>
-    <head>
-        <title>Add User Page</title>
-    </head>
-    <body>
-        <h2>Add user</h2>
-        <form method="post" action="/add-user">
-            <div>
-                <label for="username">Username:</label>
-                <input name="username" id="username" type="text">
-            </div>
-            <div>
-                <label for="email">Email:</label>
-                <input name="email" id="email" type="email">
-            <div>
-                <label for="password">Password:</label>
-                <input name="password" id="password" type="password">
-            </div>
-            <div>
-                <button type="submit">Add</button>
-            </div>
-        </form>
-    </body>
-</html>
-"""
-    return HTMLResponse(content=html)
+    return HTMLResponse(content=templates["add_user"].render())
 
 @app.post("/add-user")
-def add_user(username: Annotated[str, Form()],
-             email: Annotated[str, Form()],
-             password: Annotated[str, Form()]):
-    """Adds a new user."""
+async def add_user(db: DbSession,
+                   username: Annotated[str, Form()],
+                   email: Annotated[str, Form()],
+                   password: Annotated[str, Form()]):
+    """Adds a new user. The password is hashed in a worker process, so the slow hash does
+    not hold up other requests. With write batching the user is committed together
+    with the users and posts added at the same time."""
     try:
-        database.add_user(username=username, email=email, password=password)
+        password_hash = await asyncio.wrap_future(database.submit_password_hash(password))
+        if config.WRITE_BATCHING:
+            await asyncio.wrap_future(database.submit_user(username, email, password_hash))
+        else:
+            await async_database.run(db, database.add_user, username=username, email=email,
+                                     password_hash=password_hash)
         return RedirectResponse("/", status_code=status.HTTP_302_FOUND)
     except SQLAlchemyError as sqlalchemy_error:
-        database.rollback()
+        await async_database.run(db, database.rollback)
         return RedirectResponse(f"/error?message={sqlalchemy_error}",
                                 status_code=status.HTTP_302_FOUND)
 
 @app.get("/edit-user/{user_id}")
-def read_edit_user(user_id: int):
+async def read_edit_user(db: ReadDbSession, user_id: int, if_none_match: IfNoneMatch = None):
     """Returns a page for editing a user with a given id."""
-    user = database.get_user(user_id)
+    etag = await page_etag(db, "users")
+    if is_not_modified(if_none_match, etag):
+        return cached_page(None, etag)
+
+    user = await async_database.run(db, database.get_user, user_id)
     if user is None:
-        return RedirectResponse(f"/error?message={"User not found."}",
+        return RedirectResponse("/error?message=User not found.",
                                 status_code=status.HTTP_302_FOUND)
 
-    html = """
-<!DOCTYPE html>
-<html>
-    <head>
-        <title>Edit User Page</title>
-    </head>
-    <body>
-        <h2>Edit user</h2>
-        <form method="post" action="/edit-user/{0}">
-            <div>
-                <label for="username">Username:</label>
-                <input name="username" id="username" type="text" value="{1}">
-            </div>
-            <div>
-                <label for="email">Email:</label>
-                <input name="email" id="email" type="email" value="{2}">
-            <div>
-                <label for="password">Password:</label>
-                <input name="password" id="password" type="password" value="{3}">
-            </div>
-            <div>
-                <button type="submit">Edit</button>
-            </div>
-        </form>
-    </body>
-</html>
-"""
-    return HTMLResponse(content=html.format(user.id, user.username, user.email, user.password))
+    return cached_page(templates["edit_user"].render_row(user), etag, db)
 
 @app.post("/edit-user/{user_id}")
-def edit_user(user_id: int,
-              username: Annotated[str, Form()],
-              email: Annotated[str, Form()],
-              password: Annotated[str, Form()]):
-    """Edits a user with a given id."""
+async def edit_user(db: DbSession,
+                    user_id: int,
+                    version: Annotated[int, Form()],
+                    username: Annotated[str, Form()],
+                    email: Annotated[str, Form()],
+                    password: Annotated[str, Form()] = ""):
+    """Edits a user with a given id. An edit of an outdated version is refused.
+    An empty password keeps the current one."""
     try:
-        database.edit_user(user_id=user_id, username=username, email=email, password=password)
+        password_hash = None
+        if password:
+            password_hash = await asyncio.wrap_future(database.submit_password_hash(password))
+        await async_database.run(db, database.edit_user, user_id=user_id, version=version,
+                                 username=username, email=email, password_hash=password_hash)
         return RedirectResponse("/", status_code=status.HTTP_302_FOUND)
     except SQLAlchemyError as sqlalchemy_error:
-        database.rollback()
+        await async_database.run(db, database.rollback)
         return RedirectResponse(f"/error?message={sqlalchemy_error}",
                                 status_code=status.HTTP_302_FOUND)
+    except ValueError as value_error:
+        return RedirectResponse(f"/error?message={value_error}",
+                                status_code=status.HTTP_302_FOUND)
 
 @app.post("/delete-user/{user_id}")
-def delete_user(user_id: int):
+async def delete_user(db: DbSession, user_id: int):
     """Deletes a user with a given id."""
     try:
-        database.delete_user(user_id=user_id)
+        await async_database.run(db, database.delete_user, user_id=user_id)
         return RedirectResponse("/", status_code=status.HTTP_302_FOUND)
     except SQLAlchemyError as sqlalchemy_error:
-        database.rollback()
+        await async_database.run(db, database.rollback)
         return RedirectResponse(f"/error?message={sqlalchemy_error}",
                                 status_code=status.HTTP_302_FOUND)
     except ValueError as value_error:
@@ -207,64 +365,32 @@ def delete_user(user_id: int):
                                 status_code=status.HTTP_302_FOUND)
 
 @app.get("/add-post")
-def read_add_post():
+async def read_add_post(read_primary: ReadPrimary = None):
     """Returns a page for adding a new post."""
-    html = """
-<!DOCTYPE html>
-<html>
-    <head>
-        <title>Add Post Page</title>
-    </head>
-    <body>
-        <h2>Add post</h2>
-        <form method="post" action="/add-post">
-            <div>
-                <label for="title">Title:</label>
-                <input name="title" id="title" type="text">
-            </div>
-            <div>
-                <label for="content">Content:</label>
-                <input name="content" id="content" type="text">
-            <div>
-                <label for="user_id">User:</label>
-                <select name="user_id" id="user_id">
-                    <option selected hidden value="-1">Choose a user...</option>
-                    {0}
-                </select>
-            </div>
-            <div>
-                <button type="submit">Add</button>
-            </div>
-        </form>
-    </body>
-</html>
-"""
-
-    user_id_option_item = """<option value="{0}">{1}</option>"""
-
     try:
-        users = database.get_users()
-
-        user_id_option_items = ""
-        for user in users:
-            user_id_option_items += user_id_option_item.format(user.id, user.username) + "\n"
-
-        return HTMLResponse(content=html.format(user_id_option_items))
+        options = await render_shared(("user_options", None), read_primary is not None,
+                                      render_user_options)
+        return HTMLResponse(content=templates["add_post"].render(user_options=options))
     except SQLAlchemyError as sqlalchemy_error:
-        database.rollback()
         return RedirectResponse(f"/error?message={sqlalchemy_error}",
                                 status_code=status.HTTP_302_FOUND)
 
 @app.post("/add-post")
-def add_post(title: Annotated[str, Form()],
-             content: Annotated[str, Form()],
-             user_id: Annotated[int, Form()]):
-    """Adds a new post."""
+async def add_post(db: DbSession,
+                   title: Annotated[str, Form()],
+                   content: Annotated[str, Form()],
+                   user_id: Annotated[int, Form()]):
+    """Adds a new post. With write batching the post is committed together
+    with the users and posts added at the same time."""
     try:
-        database.add_post(title=title, content=content, user_id=user_id)
+        if config.WRITE_BATCHING:
+            await asyncio.wrap_future(database.submit_post(title, content, user_id))
+        else:
+            await async_database.run(db, database.add_post,
+                                     title=title, content=content, user_id=user_id)
         return RedirectResponse("/", status_code=status.HTTP_302_FOUND)
     except SQLAlchemyError as sqlalchemy_error:
-        database.rollback()
+        await async_database.run(db, database.rollback)
         return RedirectResponse(f"/error?message={sqlalchemy_error}",
                                 status_code=status.HTTP_302_FOUND)
     except ValueError as value_error:
@@ -272,78 +398,47 @@ def add_post(title: Annotated[str, Form()],
                                 status_code=status.HTTP_302_FOUND)
 
 @app.get("/edit-post/{post_id}")
-def read_edit_post(post_id: int):
+async def read_edit_post(db: ReadDbSession, post_id: int, if_none_match: IfNoneMatch = None,
+                         read_primary: ReadPrimary = None):
     """Returns a page for editing a post with a given id."""
-    post = database.get_post(post_id)
+    etag = await page_etag(db, "users", "posts")
+    if is_not_modified(if_none_match, etag):
+        return cached_page(None, etag)
+
+    post = await async_database.run(db, database.get_post, post_id)
     if post is None:
-        return RedirectResponse(f"/error?message={"Post not found."}",
+        return RedirectResponse("/error?message=Post not found.",
                                 status_code=status.HTTP_302_FOUND)
 
-    html = """
-<!DOCTYPE html>
-<html>
-    <head>
-        <title>Edit Post Page</title>
-    </head>
-    <body>
-        <h2>Edit post</h2>
-        <form method="post" action="/edit-post/{0}">
-            <div>
-                <label for="title">Title:</label>
-                <input name="title" id="title" type="text" value="{1}">
-            </div>
-            <div>
-                <label for="content">Content:</label>
-                <input name="content" id="content" type="text" value="{2}">
-            <div>
-                <label for="user_id">User:</label>
-                <select name="user_id" id="user_id">
-                    <option hidden value="-1">Choose a user...</option>
-                    {3}
-                </select>
-            </div>
-            <div>
-                <button type="submit">Edit</button>
-            </div>
-        </form>
-    </body>
-</html>
-"""
-
-    user_id_option_item = """<option {0} value="{1}">{2}</option>"""
-
     try:
-        users = database.get_users()
-
-        user_id_option_items = ""
-        for user in users:
-            selected = "selected" if post.user_id == user.id else ""
-            user_id_option_items += user_id_option_item.format(selected,
-                                                               user.id,
-                                                               user.username) + "\n"
-
-        print(post.id, post.title, post.content, post.user_id)
-
-        return HTMLResponse(content=html.format(post.id,
-                                                post.title,
-                                                post.content,
-                                                user_id_option_items))
+        options = await render_shared(("user_options", post.user_id, etag),
+                                      read_primary is not None,
+                                      render_user_options, post.user_id)
+        return cached_page(templates["edit_post"].render(
+            id=post.id,
+            version=post.version,
+            title=post.title,
+            content=post.content,
+            user_options=options), etag, db)
     except SQLAlchemyError as sqlalchemy_error:
-        database.rollback()
+        await async_database.run(db, database.rollback)
         return RedirectResponse(f"/error?message={sqlalchemy_error}",
                                 status_code=status.HTTP_302_FOUND)
 
 @app.post("/edit-post/{post_id}")
-def edit_post(post_id: int,
-              title: Annotated[str, Form()],
-              content: Annotated[str, Form()],
-              user_id: Annotated[str, Form()]):
-    """Edits a post with a given id."""
+async def edit_post(db: DbSession,
+                    post_id: int,
+                    version: Annotated[int, Form()],
+                    title: Annotated[str, Form()],
+                    content: Annotated[str, Form()],
+                    user_id: Annotated[int, Form()]):
+    """Edits a post with a given id. An edit of an outdated version is refused."""
     try:
-        database.edit_post(post_id=post_id, title=title, content=content, user_id=user_id)
+        await async_database.run(db, database.edit_post, post_id=post_id, version=version,
+                                 title=title, content=content, user_id=user_id)
         return RedirectResponse("/", status_code=status.HTTP_302_FOUND)
     except SQLAlchemyError as sqlalchemy_error:
-        database.rollback()
+        await async_database.run(db, database.rollback)
         return RedirectResponse(f"/error?message={sqlalchemy_error}",
                                 status_code=status.HTTP_302_FOUND)
     except ValueError as value_error:
@@ -351,33 +446,209 @@ def edit_post(post_id: int,
                                 status_code=status.HTTP_302_FOUND)
 
 @app.post("/delete-post/{post_id}")
-def delete_post(post_id: int):
+async def delete_post(db: DbSession, post_id: int):
     """Deletes a post with a given id."""
     try:
-        database.delete_post(post_id=post_id)
+        await async_database.run(db, database.delete_post, post_id=post_id)
         return RedirectResponse("/", status_code=status.HTTP_302_FOUND)
     except SQLAlchemyError as sqlalchemy_error:
-        database.rollback()
+        await async_database.run(db, database.rollback)
         return RedirectResponse(f"/error?message={sqlalchemy_error}",
                                 status_code=status.HTTP_302_FOUND)
     except ValueError as value_error:
         return RedirectResponse(f"/error?message={value_error}",
                                 status_code=status.HTTP_302_FOUND)
 
+@app.get("/search")
+async def read_search(db: ReadDbSession, q: str = "", limit: PageLimit = config.PAGE_SIZE):
+    """Returns a page with the posts matching a full-text query, best matches first."""
+    try:
+        posts = await async_database.run(db, database.search_posts, q, limit) if q else []
+        return HTMLResponse(content=templates["search"].render(
+            query=q, result_rows=templates["search_row"].render_rows(posts)))
+    except SQLAlchemyError as sqlalchemy_error:
+        await async_database.run(db, database.rollback)
+        return RedirectResponse(f"/error?message={sqlalchemy_error}",
+                                status_code=status.HTTP_302_FOUND)
+
+def read_records(upload: UploadFile, file_format: str | None):
+    """Yields records of an uploaded CSV or JSON Lines file as dicts.
+    The format is taken from the file name unless it is given explicitly.
+    JSON values that are not objects are yielded as they are and reported by the import.
+    A line that is not valid JSON, and the rest of a file that cannot be decoded or parsed,
+    become an InvalidRecord, so the report still covers the batches committed before it."""
+    if file_format is None:
+        file_format = "jsonl" if (upload.filename or "").endswith((".jsonl", ".ndjson")) else "csv"
+    if file_format not in ("csv", "jsonl"):
+        raise ValueError(f"Unknown file format {file_format}")
+
+    text = io.TextIOWrapper(upload.file, encoding="utf-8", newline="")
+    try:
+        if file_format == "csv":
+            yield from csv.DictReader(text)
+        else:
+            for line in text:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError as error:
+                        yield database.InvalidRecord(f"A record is not valid JSON: {error}")
+    except (UnicodeDecodeError, csv.Error) as error:
+        yield database.InvalidRecord(f"The rest of the file could not be read: {error}")
+
+@app.get("/import")
+async def read_import():
+    """Returns a page for importing users and posts from files."""
+    return HTMLResponse(content=templates["import"].render())
+
+@app.post("/import/{table}")
+async def import_records(db: DbSession,
+                         table: Literal["users", "posts"],
+                         file: UploadFile,
+                         file_format: Annotated[Literal["csv", "jsonl"] | None,
+                                                Query(alias="format")] = None,
+                         batch_size: Annotated[int, Query(ge=1)] = config.IMPORT_BATCH_SIZE):
+    """Imports users or posts from an uploaded file and returns a report for every batch."""
+    import_function = database.import_users if table == "users" else database.import_posts
+    records = read_records(file, file_format)
+    try:
+        if config.DATABASE_ASYNC:
+            # Under run_sync, reading the file and waiting for the password hashes
+            # would block the event loop, so the import runs in a worker thread.
+            return await async_database.run_in_thread(import_function, records, batch_size)
+        return await async_database.run(db, import_function, records, batch_size)
+    except ValueError as error:
+        return JSONResponse({"detail": f"The file could not be read: {error}"},
+                            status_code=status.HTTP_400_BAD_REQUEST)
+
+def stream_export(table: str, file_format: str, compress: bool, use_primary: bool):
+    """Yields the export file of a table, formatting rows as they are fetched."""
+    with database.get_read_session(use_primary) as db:
+        yield from export.export_rows(
+            database.API_FIELDS[table],
+            database.iter_partitions(db, database.select_export_rows(table)),
+            file_format, compress)
+
+async def stream_export_async(table: str, file_format: str, compress: bool, use_primary: bool):
+    """Yields the export file of a table, formatting rows as they are fetched."""
+    async with async_database.get_read_session(use_primary) as db:
+        async for chunk in export.export_rows_async(
+                database.API_FIELDS[table],
+                async_database.iter_partitions(db, database.select_export_rows(table)),
+                file_format, compress):
+            yield chunk
+
+@app.get("/export/{table}")
+async def read_export(table: Literal["users", "posts"],
+                      file_format: Annotated[Literal["csv", "jsonl"],
+                                             Query(alias="format")] = "csv",
+                      gzip: bool = False,
+                      read_primary: ReadPrimary = None):
+    """Returns all users or posts as a CSV or JSON Lines file, compressed with gzip if asked.
+    The file is streamed, so memory use does not depend on the size of the table."""
+    file_name = export.get_file_name(table, file_format, gzip)
+    headers = {"Content-Disposition": f'attachment; filename="{file_name}"'}
+    media_type = "application/gzip" if gzip else export.MEDIA_TYPES[file_format]
+    stream = stream_export_async if config.DATABASE_ASYNC else stream_export
+    return StreamingResponse(stream(table, file_format, gzip, read_primary is not None),
+                             media_type=media_type, headers=headers)
+
+def api_page(db, table_name: str, fields: str | None, after: int | None, limit: int,
+             user_id: int | None = None):
+    """Returns a page of rows of a table for the JSON API."""
+    return database.get_api_page(db, table_name,
+                                 fields.split(",") if fields else None,
+                                 after, limit, user_id)
+
+@app.get("/api/users")
+async def read_api_users(db: ReadDbSession,
+                         after: int | None = None,
+                         limit: PageLimit = config.PAGE_SIZE,
+                         fields: str | None = None):
+    """Returns a page of users as JSON. fields is a comma-separated list of fields."""
+    try:
+        return ORJSONResponse(await async_database.run(db, api_page, "users",
+                                                       fields, after, limit))
+    except ValueError as value_error:
+        return ORJSONResponse({"detail": str(value_error)},
+                              status_code=status.HTTP_400_BAD_REQUEST)
+
+@app.get("/api/posts")
+async def read_api_posts(db: ReadDbSession,
+                         after: int | None = None,
+                         limit: PageLimit = config.PAGE_SIZE,
+                         fields: str | None = None):
+    """Returns a page of posts as JSON. fields is a comma-separated list of fields."""
+    try:
+        return ORJSONResponse(await async_database.run(db, api_page, "posts",
+                                                       fields, after, limit))
+    except ValueError as value_error:
+        return ORJSONResponse({"detail": str(value_error)},
+                              status_code=status.HTTP_400_BAD_REQUEST)
+
+@app.get("/api/users/{user_id}/posts")
+async def read_api_user_posts(db: ReadDbSession,
+                              user_id: int,
+                              after: int | None = None,
+                              limit: PageLimit = config.PAGE_SIZE,
+                              fields: str | None = None):
+    """Returns a page of posts of a user as JSON. fields is a comma-separated list of fields."""
+    try:
+        if not await async_database.run(db, database.user_exists, user_id):
+            return ORJSONResponse({"detail": f"There is no user with id={user_id}"},
+                                  status_code=status.HTTP_404_NOT_FOUND)
+        return ORJSONResponse(await async_database.run(db, api_page, "posts",
+                                                       fields, after, limit, user_id))
+    except ValueError as value_error:
+        return ORJSONResponse({"detail": str(value_error)},
+                              status_code=status.HTTP_400_BAD_REQUEST)
+
+@app.get("/stats")
+async def read_stats(db: ReadDbSession, limit: PageLimit = config.PAGE_SIZE):
+    """Returns a page with the numbers of users and posts and the most active users."""
+    try:
+        stats = await async_database.run(db, database.get_user_stats, limit)
+        return HTMLResponse(content=templates["stats"].render(
+            users=stats["users"],
+            posts=stats["posts"],
+            user_rows=templates["stats_row"].render_rows(stats["top_users"])))
+    except SQLAlchemyError as sqlalchemy_error:
+        await async_database.run(db, database.rollback)
+        return RedirectResponse(f"/error?message={sqlalchemy_error}",
+                                status_code=status.HTTP_302_FOUND)
+
 @app.get("/error")
-def read_error(message: str):
+async def read_error(message: str):
     """Displays an error message."""
-    html = """
-<!DOCTYPE html>
-<html>
-    <head>
-        <title>Error Page</title>
-    </head>
-    <body>
-        <h2>Error</h2>
-        <p>{0}</p>
-        <form method="get" action="/"><button type="submit">To main page</button></form>
-    </body>
-</html>
-"""
-    return HTMLResponse(content=html.format(message))
+    return HTMLResponse(content=templates["error"].render(message=message))
+
+@app.get("/cache-stats")
+async def read_cache_stats():
+    """Returns the hit and miss counters of the user cache and of the page cache."""
+    return {**database.get_cache_stats(), "pages": pages.get_stats()}
+
+@app.get("/pool-stats")
+async def read_pool_stats():
+    """Returns the current state of the database connection pools."""
+    module = async_database if config.DATABASE_ASYNC else database
+    stats = module.get_pool_stats()
+    if config.REPLICA_URLS:
+        stats["replicas"] = module.get_replica_set().get_stats()
+    return stats
+
+if config.METRICS_ENABLED:
+    @app.get("/metrics")
+    async def read_metrics():
+        """Returns request, SQL, rendering and pool metrics in the Prometheus text format."""
+        pool_stats = (async_database.get_pool_stats() if config.DATABASE_ASYNC
+                      else database.get_pool_stats())
+        cache_stats = database.get_cache_stats()
+        return PlainTextResponse(metrics.render_prometheus({
+            "app_pool_checked_out": pool_stats["checked_out"],
+            "app_pool_overflow": pool_stats["overflow"],
+            "app_user_cache_hits": cache_stats["hits"],
+            "app_user_cache_misses": cache_stats["misses"],
+            "app_page_cache_hits": pages.hits,
+            "app_page_cache_misses": pages.misses,
+            "app_page_cache_coalesced": pages.coalesced,
+        }), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,205 @@
+"""This module collects SQL and request metrics and formats them as Prometheus text.
+
+Each request gets a RequestMetrics object in a context variable. Engine events add
+statement counts and database time to it, the timed pool adds the time spent waiting
+for a connection, and the template engine adds the render time. Nothing here is
+registered unless metrics or the slow query log are enabled in the configuration.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from sqlalchemy import event
+
+slow_query_logger = logging.getLogger("lab9.slow_queries")
+
+REQUEST_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class RequestMetrics:
+    """Database and rendering costs of one request."""
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+def current() -> RequestMetrics | None:
+    """Returns the metrics of the request being handled, or None outside of requests."""
+    return _current.get()
+
+class RouteMetrics:
+    """Totals of all requests to one route."""
+
+    def __init__(self):
+        self.statuses = {}
+        self.request_seconds = 0.0
+        self.bucket_counts = [0] * len(REQUEST_SECONDS_BUCKETS)
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+
+_routes = {}
+_routes_lock = threading.Lock()
+
+def _observe(method: str, route: str, status: int, seconds: float, request: RequestMetrics):
+    """Adds a finished request to the totals of its route."""
+    with _routes_lock:
+        totals = _routes.setdefault((method, route), RouteMetrics())
+        totals.statuses[status] = totals.statuses.get(status, 0) + 1
+        totals.request_seconds += seconds
+        for index, bound in enumerate(REQUEST_SECONDS_BUCKETS):
+            if seconds <= bound:
+                totals.bucket_counts[index] += 1
+        totals.statements += request.statements
+        totals.db_seconds += request.db_seconds
+        totals.render_seconds += request.render_seconds
+        totals.pool_wait_seconds += request.pool_wait_seconds
+
+# События SQLAlchemy
+
+def _before_cursor_execute(_conn, _cursor, _statement, _parameters, context, _executemany):
+    """Remembers when a statement was sent to the database. The time is kept on the execution
+    context, which goes away with the statement even if it fails. Statements the dialect runs
+    without a context, such as its first-connect checks, are not timed."""
+    if context is not None:
+        context.query_start = time.perf_counter()
+
+def _after_cursor_execute(_conn, _cursor, statement, _parameters, context, _executemany):
+    """Adds the time of a statement to the current request and logs it if it was slow."""
+    if context is None:
+        return
+    seconds = time.perf_counter() - context.query_start
+    request = _current.get()
+    if request is not None:
+        request.statements += 1
+        request.db_seconds += seconds
+    if _slow_query_seconds and seconds >= _slow_query_seconds:
+        slow_query_logger.warning("Slow query (%.1f ms): %s", seconds * 1000, statement)
+
+_slow_query_seconds = 0.0
+
+def instrument_engine(bind, slow_query_ms: float = 0):
+    """Registers the statement timing events on an engine."""
+    global _slow_query_seconds # pylint: disable=global-statement
+    _slow_query_seconds = slow_query_ms / 1000
+    event.listen(bind, "before_cursor_execute", _before_cursor_execute)
+    event.listen(bind, "after_cursor_execute", _after_cursor_execute)
+
+def timed_pool_class(pool_class):
+    """Returns a subclass of a pool class that adds the time spent waiting
+    for a connection to the current request."""
+
+    class TimedPool(pool_class):
+        """A connection pool that measures how long checkouts wait."""
+
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                request = _current.get()
+                if request is not None:
+                    request.pool_wait_seconds += time.perf_counter() - start
+
+    TimedPool.__name__ = f"Timed{pool_class.__name__}"
+    return TimedPool
+
+def observe_render(seconds: float):
+    """Adds the time spent rendering a template to the current request."""
+    request = _current.get()
+    if request is not None:
+        request.render_seconds += seconds
+
+# Промежуточный слой запросов
+
+class MetricsMiddleware:
+    """ASGI middleware that measures every HTTP request, including streamed bodies."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = RequestMetrics()
+        token = _current.set(request)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            # Unmatched paths share one label to keep the number of series bounded.
+            route_path = route.path if route is not None else "unmatched"
+            _observe(scope["method"], route_path, status, time.perf_counter() - start, request)
+
+# Формат Prometheus
+
+def _escape_label(value) -> str:
+    """Escapes a label value for the Prometheus text format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(**labels) -> str:
+    """Returns Prometheus labels with escaped values."""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"'
+                          for name, value in labels.items()) + "}"
+
+def render_prometheus(extra_gauges: dict[str, float] | None = None) -> str:
+    """Returns all collected metrics in the Prometheus text format.
+    extra_gauges are added as gauges without labels."""
+    with _routes_lock:
+        routes = [(method, route, totals) for (method, route), totals in sorted(_routes.items())]
+        lines = [
+            "# HELP app_requests_total HTTP requests handled.",
+            "# TYPE app_requests_total counter",
+        ]
+        for method, route, totals in routes:
+            for status, count in sorted(totals.statuses.items()):
+                labels = _labels(method=method, route=route, status=status)
+                lines.append(f"app_requests_total{labels} {count}")
+
+        lines += [
+            "# HELP app_request_duration_seconds Time to handle HTTP requests.",
+            "# TYPE app_request_duration_seconds histogram",
+        ]
+        for method, route, totals in routes:
+            for bound, count in zip(REQUEST_SECONDS_BUCKETS, totals.bucket_counts):
+                lines.append("app_request_duration_seconds_bucket"
+                             f"{_labels(method=method, route=route, le=bound)} {count}")
+            request_count = sum(totals.statuses.values())
+            labels = _labels(method=method, route=route)
+            lines.append("app_request_duration_seconds_bucket"
+                         f"{_labels(method=method, route=route, le='+Inf')} {request_count}")
+            lines.append(f"app_request_duration_seconds_sum{labels} {totals.request_seconds}")
+            lines.append(f"app_request_duration_seconds_count{labels} {request_count}")
+
+        for name, attribute, help_text in (
+                ("app_db_statements_total", "statements", "SQL statements executed."),
+                ("app_db_seconds_total", "db_seconds", "Time spent executing SQL statements."),
+                ("app_render_seconds_total", "render_seconds", "Time spent rendering templates."),
+                ("app_pool_wait_seconds_total", "pool_wait_seconds",
+                 "Time spent waiting for a pooled connection.")):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for method, route, totals in routes:
+                lines.append(f"{name}{_labels(method=method, route=route)} "
+                             f"{getattr(totals, attribute)}")
+
+    for name, value in (extra_gauges or {}).items():
+        lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,75 @@
+"""This module contains a short-lived cache of rendered pages with request coalescing.
+
+Concurrent requests for the same page share one computation (single flight), and its
+result is kept for a short time. Clearing the cache also detaches the computations that
+are in flight, so nothing computed before a change is stored or handed out after it.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+class PageCache:
+    """Caches the results of coroutine functions by key for ttl seconds, keeping at most
+    max_size entries. Safe to clear from other threads."""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    async def get(self, key, compute):
+        """Returns the cached result for a key. Without one, awaits the computation
+        in flight for the key or starts compute() as a new one."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            task = self._in_flight.get(key)
+            if task is None:
+                self.misses += 1
+                # The computation runs as its own task, so a request that is cancelled
+                # does not cancel it for the others.
+                task = asyncio.ensure_future(compute())
+                self._in_flight[key] = task
+                generation = self._generation
+                task.add_done_callback(lambda task: self._finish(key, task, generation))
+            else:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task, generation: int):
+        """Stores the result of a computation unless the cache was cleared in the meantime."""
+        with self._lock:
+            if self._in_flight.get(key) is task:
+                del self._in_flight[key]
+            # Reading the exception marks it as retrieved even if nobody waits for the task.
+            if task.cancelled() or task.exception() is not None:
+                return
+            if generation == self._generation and self.ttl > 0:
+                self._entries[key] = (task.result(), time.monotonic() + self.ttl)
+                self._entries.move_to_end(key)
+                if len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+
+    def clear(self, _changed_tables=None):
+        """Removes all entries and detaches the computations in flight.
+        Can be registered with database.on_tables_changed."""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._in_flight.clear()
+
+    def get_stats(self):
+        """Returns the hit, miss and coalesced request counters and the number of entries."""
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                "size": len(self._entries)}
@@ -0,0 +1,125 @@
+"""This module contains a small template engine for the HTML pages.
+
+Templates use str.format field names ({name}, with {{ and }} for literal braces).
+They are compiled once when loaded into Python functions that build the page with
+a single f-string, and values are HTML-escaped unless they are Markup.
+"""
+
+import re
+import time
+from functools import wraps
+from html import escape
+from pathlib import Path
+from string import Formatter
+from types import SimpleNamespace
+
+class Markup(str):
+    """A string of HTML that is inserted into templates without escaping."""
+
+_render_observer = None
+
+def set_render_observer(observer):
+    """Sets a function that is called with the duration in seconds of every render.
+    None turns the timing off."""
+    global _render_observer # pylint: disable=global-statement
+    _render_observer = observer
+
+def _timed(render):
+    """Wraps a rendering method so that its duration is reported to the render observer."""
+    @wraps(render)
+    def timed_render(*args, **kwargs):
+        if _render_observer is None:
+            return render(*args, **kwargs)
+        start = time.perf_counter()
+        result = render(*args, **kwargs)
+        _render_observer(time.perf_counter() - start)
+        return result
+    return timed_render
+
+_needs_escaping = re.compile(r"[&<>\"']").search
+
+def to_html(value) -> str:
+    """Returns a value as HTML, escaping it unless it is Markup."""
+    if type(value) is int: # pylint: disable=unidiomatic-typecheck
+        return str(value)
+    if isinstance(value, Markup):
+        return value
+    value = str(value)
+    return escape(value) if _needs_escaping(value) else value
+
+def _compile(parts):
+    """Compiles the parts of a template into a function that renders the attributes
+    of its argument with one f-string."""
+    pieces = []
+    for literal, field_name in parts:
+        pieces.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field_name:
+            # Plain strings without special characters skip the call to to_html.
+            pieces.append(f"{{v if (v := row.{field_name}).__class__ is str "
+                          f"and not needs_escaping(v) else to_html(v)}}")
+    source = ("def render_row(row, to_html=to_html, needs_escaping=needs_escaping):\n"
+              f"    return f{''.join(pieces)!r}\n")
+    namespace = {"to_html": to_html, "needs_escaping": _needs_escaping}
+    exec(compile(source, "<template>", "exec"), namespace) # pylint: disable=exec-used
+    return namespace["render_row"]
+
+class Template:
+    """A template compiled into a rendering function. The parsed parts are kept for streaming."""
+
+    def __init__(self, source: str):
+        self.parts = []
+        for literal, field_name, format_spec, conversion in Formatter().parse(source):
+            if field_name is not None and not field_name.isidentifier():
+                raise ValueError(f"A field name must be an identifier: {field_name!r}")
+            if format_spec or conversion:
+                raise ValueError(f"Format specs and conversions are not supported: {field_name}")
+            self.parts.append((literal, field_name))
+        self.field_names = [field_name for _, field_name in self.parts if field_name]
+        self._render_row = _compile(self.parts)
+
+    @_timed
+    def render(self, **context) -> Markup:
+        """Returns the template rendered with the given values."""
+        return Markup(self._render_row(SimpleNamespace(**context)))
+
+    @_timed
+    def render_row(self, row) -> Markup:
+        """Returns the template rendered with the attributes of an object.
+        Works with ORM objects, result rows and named tuples."""
+        return Markup(self._render_row(row))
+
+    @_timed
+    def render_rows(self, rows) -> Markup:
+        """Returns the template rendered once for every row, without separators."""
+        render_row = self._render_row
+        return Markup("".join([render_row(row) for row in rows]))
+
+    def render_chunks(self, **context):
+        """Yields the template in pieces. A value that is an iterable of Markup
+        (such as a generator of rendered rows) is yielded item by item."""
+        for literal, field_name in self.parts:
+            yield literal
+            if field_name:
+                value = context[field_name]
+                if isinstance(value, str):
+                    yield to_html(value)
+                else:
+                    yield from value
+
+    async def render_chunks_async(self, **context):
+        """Yields the template in pieces. A value that is an async iterable of Markup
+        is yielded item by item."""
+        for literal, field_name in self.parts:
+            yield literal
+            if field_name:
+                value = context[field_name]
+                if isinstance(value, str):
+                    yield to_html(value)
+                else:
+                    async for item in value:
+                        yield item
+
+def load_templates(directory: Path) -> dict[str, Template]:
+    """Compiles every .html file of a directory. The keys are the file names without suffix."""
+    return {path.stem: Template(path.read_text(encoding="utf-8"))
+            for path in sorted(directory.glob("*.html"))}
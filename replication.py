@@ -0,0 +1,56 @@
+"""This module contains a stand-in for database replication, for trying read replicas locally.
+
+The primary SQLite database is copied into every replica file with the SQLite backup API
+at a fixed interval, so the replicas lag behind the primary by up to that interval,
+like asynchronous replicas of a real database server.
+"""
+
+import logging
+import sqlite3
+import threading
+from contextlib import closing
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger("lab9.replication")
+
+def get_sqlite_path(url: str) -> str:
+    """Returns the path of the database file of an SQLite URL."""
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        raise ValueError(f"The stub replicator needs SQLite database files, not {url}")
+    return url.database
+
+def copy_database(primary_path: str, replica_paths: list[str]):
+    """Copies the primary database into every replica database."""
+    with closing(sqlite3.connect(primary_path)) as primary:
+        for replica_path in replica_paths:
+            with closing(sqlite3.connect(replica_path)) as replica:
+                primary.backup(replica)
+
+class StubReplicator:
+    """Copies the primary database into the replicas in a background thread."""
+
+    def __init__(self, primary_url: str, replica_urls: list[str], interval: float):
+        self.primary_path = get_sqlite_path(primary_url)
+        self.replica_paths = [get_sqlite_path(url) for url in replica_urls]
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stub-replicator", daemon=True)
+
+    def start(self):
+        """Makes the first copy and starts copying at the interval."""
+        copy_database(self.primary_path, self.replica_paths)
+        self._thread.start()
+
+    def stop(self):
+        """Stops copying."""
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        """Copies the database until stopped. A failed copy is logged and retried."""
+        while not self._stopped.wait(self.interval):
+            try:
+                copy_database(self.primary_path, self.replica_paths)
+            except sqlite3.Error as error:
+                logger.warning("Replication failed: %s", error)
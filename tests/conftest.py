@@ -0,0 +1,34 @@
+"""Fixtures shared by the tests: a file-backed SQLite database with the full schema."""
+
+import pytest
+from sqlalchemy import create_engine, event
+import database
+
+@pytest.fixture
+def engine(tmp_path):
+    """Returns an engine of a new SQLite database created with init_db."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    database.configure_engine(engine)
+    database.init_db(engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def db(engine):
+    """Yields a session of the test database. The user cache starts empty."""
+    database.user_cache.clear()
+    with database.session(bind=engine) as session:
+        yield session
+    database.user_cache.clear()
+
+@pytest.fixture
+def statements(engine):
+    """Returns a list that collects the SQL statements the engine executes."""
+    executed = []
+
+    def collect(_conn, _cursor, statement, _parameters, _context, _executemany):
+        executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", collect)
+    yield executed
+    event.remove(engine, "before_cursor_execute", collect)
@@ -0,0 +1,30 @@
+"""Tests that the import reports the records it skips next to the batches it committed."""
+
+import database
+
+def test_invalid_records_are_reported_after_committed_batches(db):
+    database.add_user(db, username="user", email="user@example.com", password_hash="hash")
+    records = [{"title": "First", "content": "Content", "user_id": 1},
+               database.InvalidRecord("A record is not valid JSON"),
+               "not an object",
+               {"title": "Last", "content": "Content", "user_id": 1}]
+
+    report = database.import_posts(db, records, batch_size=1)
+
+    assert report["inserted"] == 2
+    assert report["skipped"] == 2
+    assert [(error["records"], error["messages"]) for error in report["errors"]] == [
+        ([2, 2], ["A record is not valid JSON"]),
+        ([3, 3], ["A record is not an object"]),
+    ]
+
+def test_empty_fields_are_missing(db, monkeypatch):
+    monkeypatch.setattr(database, "hash_passwords",
+                        lambda passwords: [f"hash-{password}" for password in passwords])
+    records = [{"username": "user", "email": "user@example.com", "password": ""},
+               {"username": "other", "email": "other@example.com", "password": "password"}]
+
+    report = database.import_users(db, records)
+
+    assert report["inserted"] == 1
+    assert report["errors"][0]["messages"] == ["A record is missing the field 'password'"]
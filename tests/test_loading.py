@@ -0,0 +1,46 @@
+"""Statement counts of listing posts with each loading strategy of get_posts."""
+
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.exc import InvalidRequestError
+import database
+
+USERS = 20
+POSTS = 100
+
+@pytest.fixture
+def seeded_db(db):
+    """Returns a session of a database with POSTS posts spread over USERS authors."""
+    db.execute(insert(database.User), [{"username": f"user{i}", "email": f"user{i}@example.com",
+                                        "password": "-"} for i in range(1, USERS + 1)])
+    db.execute(insert(database.Post), [{"title": f"Post {i}", "content": "Content",
+                                        "user_id": i % USERS + 1} for i in range(POSTS)])
+    db.commit()
+    db.expunge_all()
+    return db
+
+def list_posts(db, loading):
+    """Returns the title and author name of every post loaded with a strategy."""
+    return [(post.title, post.user.username) for post in database.get_posts(db, loading)]
+
+@pytest.mark.parametrize("loading, expected", [("joined", 1), ("selectin", 2)])
+def test_eager_loading_does_not_depend_on_post_count(seeded_db, statements, loading, expected):
+    listing = list_posts(seeded_db, loading)
+    assert len(listing) == POSTS
+    assert len(statements) == expected
+
+def test_lazy_loading_queries_every_author(seeded_db, statements):
+    list_posts(seeded_db, None)
+    assert len(statements) == 1 + USERS
+
+def test_raise_loading_refuses_to_load_authors(seeded_db, statements):
+    posts = database.get_posts(seeded_db, "raise")
+    with pytest.raises(InvalidRequestError):
+        posts[0].user # pylint: disable=pointless-statement
+    assert len(statements) == 1
+
+def test_posts_with_authors_use_one_statement(seeded_db, statements):
+    posts = database.get_posts_with_authors(seeded_db, with_content=True)
+    assert [post.content for post in posts] == ["Content"] * POSTS
+    assert {post.user.username for post in posts} == {f"user{i}" for i in range(1, USERS + 1)}
+    assert len(statements) == 1
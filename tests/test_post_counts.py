@@ -0,0 +1,51 @@
+"""Tests that every code path that adds, moves or deletes posts keeps the post counts right."""
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm.exc import StaleDataError
+import database
+
+def test_post_counts_stay_right(engine, db, monkeypatch):
+    # The write batcher opens its sessions with get_session, and add_data hashes
+    # passwords, which is not what this test is about.
+    monkeypatch.setattr(database, "_engine", engine)
+    monkeypatch.setitem(database.session.kw, "bind", engine)
+    monkeypatch.setattr(database, "hash_passwords",
+                        lambda passwords: [f"hash-{password}" for password in passwords])
+
+    database.add_data(db)
+    assert database.check_post_counts(db) == []
+
+    database.add_post(db, "Title", "Content", 1)
+    assert database.check_post_counts(db) == []
+
+    batcher = database.WriteBatcher(max_size=10, max_wait=0.01)
+    futures = [batcher.submit(database._add_post, title="Batched", content="Content", user_id=1),
+               batcher.submit(database._add_post, title="Batched", content="Content", user_id=3),
+               batcher.submit(database._add_post, title="Missing", content="Content", user_id=99)]
+    batcher.stop()
+    assert [future.exception() is None for future in futures] == [True, True, False]
+    assert database.check_post_counts(db) == []
+
+    report = database.import_posts(db, [{"title": "Imported", "content": "Content", "user_id": 4},
+                                        {"title": "Imported", "content": "Content", "user_id": 4},
+                                        {"title": "Missing", "content": "Content", "user_id": 99}])
+    assert report["inserted"] == 2
+    assert database.check_post_counts(db) == []
+
+    # Post 1 belongs to user 2 and is moved to user 3.
+    database.edit_post(db, 1, 1, "Moved", "Content", 3)
+    assert database.check_post_counts(db) == []
+
+    # A stale edit must not move the post between the counts.
+    with pytest.raises(StaleDataError):
+        database.edit_post(db, 1, 1, "Stale", "Content", 4)
+    assert db.scalar(select(database.Post.user_id).where(database.Post.id == 1)) == 3
+    assert database.check_post_counts(db) == []
+
+    database.delete_post(db, 2)
+    assert database.check_post_counts(db) == []
+
+    database.update_data(db)
+    database.delete_data(db)
+    assert database.check_post_counts(db) == []
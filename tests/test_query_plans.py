@@ -0,0 +1,15 @@
+"""The per-user queries on posts must keep using the (user_id, id) index."""
+
+from sqlalchemy import text
+import database
+
+def test_per_user_queries_use_an_index(db):
+    assert database.check_query_plans(db) == []
+
+def test_dropping_the_index_is_reported(db):
+    db.execute(text("DROP INDEX ix_posts_user_id_id"))
+    db.commit()
+    problems = database.check_query_plans(db)
+    descriptions = {problem.split(":")[0] for problem in problems}
+    # The listing ordered by id can still walk the primary key, so it is not expected here.
+    assert {"posts of a user", "deleting posts of users"} <= descriptions
@@ -0,0 +1,31 @@
+"""Tests that the table versions are kept in the database, so every process sees them."""
+
+import database
+
+def test_commit_bumps_versions_seen_by_other_sessions(engine, db):
+    with database.session(bind=engine) as other:
+        before = database.get_table_version(other, "users", "posts")
+        other.rollback()
+
+        database.add_user(db, username="user", email="user@example.com", password_hash="hash")
+
+        users, posts = database.get_table_version(other, "users", "posts").split(".")
+        assert int(users) == int(before.split(".")[0]) + 1
+        assert posts == before.split(".")[1]
+
+def test_rollback_keeps_versions(engine, db):
+    before = database.get_table_version(db, "users")
+    db.add(database.User(username="user", email="user@example.com", password="hash"))
+    db.flush()
+    db.rollback()
+
+    with database.session(bind=engine) as other:
+        assert database.get_table_version(other, "users") == before
+
+def test_migrate_adds_missing_versions(engine, db):
+    db.execute(database.delete(database.TableVersion))
+    db.commit()
+
+    database.migrate(engine)
+
+    assert database.get_table_version(db, "users", "posts") == "0.0"
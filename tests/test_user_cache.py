@@ -0,0 +1,33 @@
+"""Tests that the user cache does not hide users added by another process."""
+
+from sqlalchemy import create_engine, insert, update
+import database
+
+def add_user_elsewhere(engine, user_id):
+    """Inserts a user and bumps the version of the users table through a connection of its
+    own, like another worker would. The session events of this process do not see it."""
+    other_engine = create_engine(engine.url)
+    with other_engine.begin() as connection:
+        connection.execute(insert(database.User), {"id": user_id, "username": f"user{user_id}",
+                                                   "email": f"user{user_id}@example.com"})
+        connection.execute(update(database.TableVersion)
+                           .where(database.TableVersion.table_name == "users")
+                           .values(version=database.TableVersion.version + 1))
+    other_engine.dispose()
+
+def test_missing_user_is_not_cached(engine, db):
+    assert not database.user_exists(db, 1)
+    db.rollback()
+
+    add_user_elsewhere(engine, 1)
+
+    assert database.user_exists(db, 1)
+    database.add_post(db, "Title", "Content", 1)
+
+def test_directory_follows_other_processes(engine, db):
+    assert database.get_user_directory(db) == []
+    db.rollback()
+
+    add_user_elsewhere(engine, 1)
+
+    assert [user.id for user in database.get_user_directory(db)] == [1]